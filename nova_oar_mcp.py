@@ -7,18 +7,133 @@ Provides tools to list machines, manage jobs, and interact with the cluster.
 """
 
 import os
+import atexit
 import subprocess
 import asyncio
+import collections
+import contextlib
 import json
-from typing import Optional, List, Dict, Any
+import time
+from typing import Optional, List, Dict, Any, Union, AsyncIterator
 import re
+import shlex
 from dataclasses import dataclass
 
 from mcp.server.fastmcp import FastMCP
 
+# orjson parses large oarstat/oarnodes documents considerably faster when available
+try:
+    import orjson
+    json_loads = orjson.loads
+    JSONDecodeError = orjson.JSONDecodeError
+except ImportError:
+    json_loads = json.loads
+    JSONDecodeError = json.JSONDecodeError
+
+# ijson lets list_all_jobs parse oarstat output incrementally as it arrives
+try:
+    import ijson
+except ImportError:
+    ijson = None
+
 # Configuration
 CLUSTER_HOSTNAME = os.environ.get("CLUSTER_HOSTNAME", "cluster")
 
+# "openssh" forks the ssh client per command, "asyncssh" keeps a single
+# in-process connection open instead (requires the asyncssh package)
+SSH_BACKEND = os.environ.get("NOVA_OAR_SSH_BACKEND", "openssh")
+if SSH_BACKEND not in ("openssh", "asyncssh"):
+    raise ValueError(f"Invalid NOVA_OAR_SSH_BACKEND {SSH_BACKEND!r}, expected 'openssh' or 'asyncssh'")
+if SSH_BACKEND == "asyncssh":
+    import asyncssh
+
+# SSH connection multiplexing: the first ssh invocation becomes the master and
+# later ones reuse its connection through the control socket. Each server
+# process gets its own socket so it only ever stops a master it owns
+# (%C is a short hash of the connection, keeping the path under the socket limit)
+SSH_CONTROL_DIR = os.path.expanduser("~/.ssh")
+SSH_CONTROL_PATH = os.path.join(SSH_CONTROL_DIR, f"nova-oar-cm-{os.getpid()}-%C")
+os.makedirs(SSH_CONTROL_DIR, mode=0o700, exist_ok=True)
+
+# Fixed part of every ssh client invocation, the remote command is appended.
+# Compression only takes effect on the connection that becomes the master.
+_SSH_ARGV_PREFIX = (
+    "ssh",
+    "-o", "ControlMaster=auto",
+    "-o", f"ControlPath={SSH_CONTROL_PATH}",
+    "-o", "ControlPersist=600",
+    "-o", "ServerAliveInterval=30",
+    "-o", "Compression=yes",
+    CLUSTER_HOSTNAME,
+)
+
+# Marker printed after each command of a batch, followed by its exit status
+BATCH_SEPARATOR = "__NOVA_SEP__"
+_BATCH_SEPARATOR_RE = re.compile(rf'(?:^|\n){BATCH_SEPARATOR}(\d+)(?:\n|$)')
+
+# Printed by create_job's remote cluster check when it skips oarsub
+SKIPPED_MARKER = "__NOVA_SKIPPED__"
+
+# Walltime in hh:mm:ss format and the job ID printed by oarsub
+_WALLTIME_RE = re.compile(r'^(?P<hours>\d{1,2}):(?P<minutes>\d{2}):(?P<seconds>\d{2})$')
+_JOBID_RE = re.compile(r'OAR_JOB_ID=(\d+)')
+_OARDEL_STATUS_RE = re.compile(r'Deleting the job = (\d+) \.*([A-Z_]+)')
+
+# How long, in seconds, the machine lists are cached before hitting oarnodes again
+CACHE_TTL = float(os.environ.get("NOVA_OAR_CACHE_TTL", "120"))
+
+# Cached (timestamp, value) pairs, refreshed under a lock to avoid concurrent fetches
+_MACHINES_CACHE: Optional[tuple[float, List[str]]] = None
+_MACHINES_DETAILED_CACHE: Optional[tuple[float, Dict[str, Any]]] = None
+_machines_lock = asyncio.Lock()
+_machines_detailed_lock = asyncio.Lock()
+
+# Maximum number of SSH commands running at the same time
+SSH_CONCURRENCY = int(os.environ.get("NOVA_OAR_SSH_CONCURRENCY", "8"))
+if SSH_CONCURRENCY < 1:
+    raise ValueError(f"Invalid NOVA_OAR_SSH_CONCURRENCY {SSH_CONCURRENCY}, expected at least 1")
+_ssh_semaphore = asyncio.Semaphore(SSH_CONCURRENCY)
+
+# Long-lived master connection started by main(). It stays in the foreground
+# so the server holds its process handle and can always stop it
+_SSH_MASTER_ARGV = (
+    "ssh", "-M", "-N",
+    "-o", f"ControlPath={SSH_CONTROL_PATH}",
+    "-o", "ControlPersist=no",
+    "-o", "ServerAliveInterval=30",
+    "-o", "ConnectTimeout=30",
+    # oarstat/oarnodes JSON compresses well, shrinking it on the wire
+    "-o", "Compression=yes",
+    CLUSTER_HOSTNAME,
+)
+
+# How often, in seconds, the master is checked with ssh -O check
+SSH_MASTER_CHECK_INTERVAL = 30
+
+# Master process and the time of its last check, None unless main() manages it
+_ssh_master: Optional[subprocess.Popen] = None
+_ssh_master_checked: Optional[float] = None
+_ssh_master_lock = asyncio.Lock()
+
+# In-process connection used by the asyncssh backend
+_ssh_conn: Optional["asyncssh.SSHClientConnection"] = None
+_ssh_conn_lock = asyncio.Lock()
+
+# Contents of the cluster://config resource, fixed once CLUSTER_HOSTNAME is read
+CLUSTER_CONFIG = f"""NOVA OAR Cluster Configuration:
+- Cluster Hostname: {CLUSTER_HOSTNAME}
+- Default Walltime: 1:00:00
+- Default Nodes: 1
+- Default Command: sleep 365d
+
+Available OAR Commands:
+- List machines: oarnodes -l
+- List jobs: oarstat
+- Create job: oarsub -l <resources> <command>
+- Delete job: oardel <jobid>
+- Extend walltime: oarwalltime <jobid> +<time>
+"""
+
 # Create the MCP server
 mcp = FastMCP("NOVA OAR Cluster Manager")
 
@@ -34,65 +149,462 @@ class JobCreationParams:
     best_effort: bool = False
 
 
-async def run_ssh_command(command: str) -> str:
-    """Execute a command on the cluster via SSH"""
-    full_command = ["ssh", CLUSTER_HOSTNAME, command]
+def ssh_control_command(operation: str) -> tuple[str, ...]:
+    """Build an ssh -O invocation sending operation to the master connection"""
+    return ("ssh", "-O", operation, "-o", f"ControlPath={SSH_CONTROL_PATH}", CLUSTER_HOSTNAME)
+
+
+def _run_quiet(argv: tuple[str, ...], timeout: float) -> int:
+    """Run a local command with no I/O, returning its exit status (-1 on timeout)"""
     try:
-        result = subprocess.run(
-            full_command,
-            capture_output=True,
-            text=True,
-            check=True,
-            timeout=30
-        )
-        return result.stdout.strip()
-    except subprocess.CalledProcessError as e:
-        raise ValueError(f"Command failed: {e.stderr.strip()}")
+        return subprocess.run(
+            argv,
+            stdin=subprocess.DEVNULL,
+            stdout=subprocess.DEVNULL,
+            stderr=subprocess.DEVNULL,
+            timeout=timeout
+        ).returncode
     except subprocess.TimeoutExpired:
+        return -1
+
+
+async def _run_quiet_async(argv: tuple[str, ...], timeout: float) -> int:
+    """Like _run_quiet, without blocking the event loop"""
+    proc = await asyncio.create_subprocess_exec(
+        *argv,
+        stdin=asyncio.subprocess.DEVNULL,
+        stdout=asyncio.subprocess.DEVNULL,
+        stderr=asyncio.subprocess.DEVNULL
+    )
+    try:
+        return await asyncio.wait_for(proc.wait(), timeout=timeout)
+    except asyncio.TimeoutError:
+        proc.kill()
+        await proc.wait()
+        return -1
+
+
+def start_ssh_master() -> None:
+    """
+    Start the persistent SSH master connection without waiting for it
+
+    Tool calls made before it has authenticated open their own connection,
+    ControlMaster=auto letting the first of them serve as master meanwhile.
+    """
+    global _ssh_master, _ssh_master_checked
+    _ssh_master = subprocess.Popen(
+        _SSH_MASTER_ARGV,
+        stdin=subprocess.DEVNULL,
+        stdout=subprocess.DEVNULL,
+        stderr=subprocess.DEVNULL
+    )
+    _ssh_master_checked = time.monotonic()
+
+
+def _terminate_ssh_master() -> None:
+    """Terminate the master process if it is still running"""
+    if _ssh_master is None or _ssh_master.poll() is not None:
+        return
+    _ssh_master.terminate()
+    try:
+        _ssh_master.wait(timeout=5)
+    except subprocess.TimeoutExpired:
+        _ssh_master.kill()
+        _ssh_master.wait()
+
+
+def stop_ssh_master() -> None:
+    """Stop the SSH master connection, and any client that took over as master"""
+    global _ssh_master, _ssh_master_checked
+    _run_quiet(ssh_control_command("exit"), timeout=5)
+    _terminate_ssh_master()
+    _ssh_master = None
+    _ssh_master_checked = None
+
+
+async def ensure_ssh_master() -> None:
+    """Check the SSH master every SSH_MASTER_CHECK_INTERVAL seconds, respawning it if it is gone"""
+    global _ssh_master_checked
+    if _ssh_master_checked is None or time.monotonic() - _ssh_master_checked < SSH_MASTER_CHECK_INTERVAL:
+        return
+    async with _ssh_master_lock:
+        # Another task may have checked while we waited
+        if time.monotonic() - _ssh_master_checked < SSH_MASTER_CHECK_INTERVAL:
+            return
+        if await _run_quiet_async(ssh_control_command("check"), timeout=5) != 0:
+            # A master still running here failed to connect or lost the
+            # socket, so replace it rather than leave it lingering
+            _terminate_ssh_master()
+            start_ssh_master()
+        _ssh_master_checked = time.monotonic()
+
+
+def ssh_command_line(command: str) -> tuple[str, ...]:
+    """Build the ssh client invocation for running command on the cluster"""
+    return _SSH_ARGV_PREFIX + (command,)
+
+
+async def get_ssh_connection() -> "asyncssh.SSHClientConnection":
+    """Return the shared asyncssh connection, connecting on first use or after it closed"""
+    global _ssh_conn
+    async with _ssh_conn_lock:
+        if _ssh_conn is None or _ssh_conn.is_closed():
+            # Host, user and keys are resolved from ~/.ssh/config like the ssh client
+            _ssh_conn = await asyncssh.connect(
+                CLUSTER_HOSTNAME,
+                connect_timeout=30,
+                keepalive_interval=30,
+                # Prefer compression but still connect if the server disables it
+                compression_algs=["zlib@openssh.com", "zlib", "none"]
+            )
+        return _ssh_conn
+
+
+def drop_ssh_connection(conn: "asyncssh.SSHClientConnection") -> None:
+    """Close a broken asyncssh connection, forgetting it if it is still the shared one"""
+    global _ssh_conn
+    if _ssh_conn is conn:
+        _ssh_conn = None
+    conn.close()
+
+
+async def _asyncssh_open(command: str) -> tuple["asyncssh.SSHClientConnection", "asyncssh.SSHClientProcess"]:
+    """
+    Start command on the shared asyncssh connection, returning (conn, process)
+
+    Connecting and opening the channel are retried once if the connection
+    dropped; nothing after that is, so a command never runs twice. Every
+    asyncssh or OS level failure is raised as ValueError.
+    """
+    for attempt in range(2):
+        conn = None
+        try:
+            conn = await get_ssh_connection()
+            return conn, await conn.create_process(command, encoding=None)
+        except asyncio.TimeoutError:
+            raise ValueError("Command timed out")
+        except (asyncssh.Error, OSError) as e:
+            if isinstance(e, asyncssh.ChannelOpenError) and not conn.is_closed():
+                # The server refused this session (e.g. MaxSessions), the
+                # connection itself is still usable by other commands
+                raise ValueError(f"Command failed: {str(e)}")
+            if conn is None:
+                raise ValueError(f"Failed to connect to {CLUSTER_HOSTNAME}: {str(e)}")
+            drop_ssh_connection(conn)
+            if attempt:
+                raise ValueError(f"Command failed: {str(e)}")
+
+
+async def _asyncssh_exec(command: str, text: bool = True) -> tuple[int, Union[str, bytes], str]:
+    """Execute a command over the shared asyncssh connection"""
+    conn, proc = await _asyncssh_open(command)
+    try:
+        result = await proc.wait(timeout=30)
+    except asyncio.TimeoutError:
+        # Close the channel, or every timeout would hold a session open
+        await _abort_process(proc)
         raise ValueError("Command timed out")
+    except (asyncssh.Error, OSError) as e:
+        # The command may already have run, so it is not retried
+        if conn.is_closed():
+            drop_ssh_connection(conn)
+        raise ValueError(f"Command failed: {str(e)}")
+    if result.returncode is None:
+        # The channel closed without an exit status, e.g. the connection dropped
+        raise ValueError("Command failed: no exit status received")
+    stdout = result.stdout.strip()
+    return result.returncode, stdout.decode() if text else stdout, result.stderr.decode().strip()
+
+
+async def _ssh_exec(command: str, text: bool = True) -> tuple[int, Union[str, bytes], str]:
+    """
+    Execute a command on the cluster via SSH, returning (returncode, stdout, stderr)
+
+    With text=False stdout is returned as undecoded bytes. At most
+    SSH_CONCURRENCY commands run at once; further calls wait their turn.
+    """
+    # Bound the number of concurrent sessions to stay under sshd's MaxSessions
+    async with _ssh_semaphore:
+        if SSH_BACKEND == "asyncssh":
+            return await _asyncssh_exec(command, text)
+        await ensure_ssh_master()
+        proc = await asyncio.create_subprocess_exec(
+            *ssh_command_line(command),
+            # Keep ssh off the server's stdin, which carries the MCP protocol
+            stdin=asyncio.subprocess.DEVNULL,
+            stdout=asyncio.subprocess.PIPE,
+            stderr=asyncio.subprocess.PIPE
+        )
+        try:
+            stdout, stderr = await asyncio.wait_for(proc.communicate(), timeout=30)
+        except asyncio.TimeoutError:
+            proc.kill()
+            await proc.wait()
+            raise ValueError("Command timed out")
+        stdout = stdout.strip()
+        return proc.returncode, stdout.decode() if text else stdout, stderr.decode().strip()
+
+
+async def _abort_process(proc: Any) -> None:
+    """Stop a command that is still running, waiting at most 5 seconds for it to exit"""
+    if SSH_BACKEND == "asyncssh":
+        # Closing the channel frees the session even if the remote side ignores signals
+        proc.close()
+    else:
+        proc.kill()
+    try:
+        await asyncio.wait_for(proc.wait(), timeout=5)
+    except Exception:
+        pass
+
+
+async def ssh_stream(command: str, chunk_size: int = 65536) -> AsyncIterator[bytes]:
+    """
+    Execute a command on the cluster via SSH, yielding its stdout in chunks
+
+    Raises ValueError if no output arrives for 30 seconds, or once the output
+    is exhausted if the command failed.
+    """
+    async with _ssh_semaphore:
+        conn = None
+        if SSH_BACKEND == "asyncssh":
+            conn, proc = await _asyncssh_open(command)
+            errors = (asyncssh.Error, OSError)
+        else:
+            await ensure_ssh_master()
+            proc = await asyncio.create_subprocess_exec(
+                *ssh_command_line(command),
+                # Keep ssh off the server's stdin, which carries the MCP protocol
+                stdin=asyncio.subprocess.DEVNULL,
+                stdout=asyncio.subprocess.PIPE,
+                stderr=asyncio.subprocess.PIPE
+            )
+            errors = (OSError,)
+        stderr = asyncio.ensure_future(proc.stderr.read())
+        try:
+            while chunk := await asyncio.wait_for(proc.stdout.read(chunk_size), timeout=30):
+                yield chunk
+            await asyncio.wait_for(proc.wait(), timeout=30)
+        except asyncio.TimeoutError:
+            raise ValueError("Command timed out")
+        except errors as e:
+            # The connection dropped while streaming
+            if conn is not None:
+                drop_ssh_connection(conn)
+            raise ValueError(f"Command failed: {str(e)}")
+        finally:
+            if proc.returncode is None:
+                await _abort_process(proc)
+            # Collect stderr, giving up on it if the stream does not end
+            try:
+                error_output = (await asyncio.wait_for(stderr, timeout=5)).decode().strip()
+            except Exception:
+                error_output = ""
+        if proc.returncode != 0:
+            raise ValueError(f"Command failed: {error_output}")
+
+
+async def run_ssh(command: str, text: bool = True) -> tuple[bool, Union[str, bytes]]:
+    """
+    Execute a command on the cluster via SSH, returning (ok, output)
+
+    On success output is the command's stdout (bytes if text is False),
+    otherwise it is an error message. Failures are returned rather than
+    raised so callers can branch on them cheaply.
+    """
+    try:
+        returncode, stdout, stderr = await _ssh_exec(command, text)
+    except ValueError as e:
+        return False, str(e)
+    if returncode != 0:
+        return False, f"Command failed: {stderr}"
+    return True, stdout
+
+
+async def run_ssh_command(command: str, text: bool = True) -> Union[str, bytes]:
+    """Execute a command on the cluster via SSH, returning bytes if text is False"""
+    ok, output = await run_ssh(command, text)
+    if not ok:
+        raise ValueError(output)
+    return output
+
+
+async def ssh_json(command: str, error_message: str) -> Dict[str, Any]:
+    """
+    Execute a command that prints JSON and parse its output
+
+    Failures are reported as a dict with an "error" key, prefixed with
+    error_message if the command itself failed.
+    """
+    ok, output = await run_ssh(command, text=False)
+    if not ok:
+        return {"error": f"{error_message}: {output}"}
+    try:
+        return json_loads(output)
+    except JSONDecodeError as e:
+        return {"error": f"Failed to parse JSON output: {str(e)}", "raw_output": output.decode(errors="replace")}
+
+
+async def run_ssh_batch(commands: List[str]) -> List[str]:
+    """
+    Execute several commands on the cluster in a single SSH round-trip
+
+    Commands run sequentially in the same remote shell, so shell variables set
+    by one command are visible to the next. Returns the output of each command.
+    """
+    script = " ".join(f"{cmd}; printf '\\n{BATCH_SEPARATOR}%s\\n' $?;" for cmd in commands)
+    returncode, stdout, stderr = await _ssh_exec(script)
+    parts = _BATCH_SEPARATOR_RE.split(stdout)
+    if returncode != 0 or len(parts) < 2 * len(commands) + 1:
+        raise ValueError(f"Command failed: {stderr or f'ssh exited with status {returncode}'}")
+
+    outputs = []
+    for i in range(len(commands)):
+        output, status = parts[2 * i], parts[2 * i + 1]
+        if status != "0":
+            raise ValueError(f"Command failed: {stderr or f'exited with status {status}'}")
+        outputs.append(output.strip())
+    return outputs
 
 
 @mcp.tool()
 async def list_machines() -> List[str]:
     """List all machine hostnames in the cluster"""
-    output = await run_ssh_command("oarnodes -l")
-    machines = [line.strip() for line in output.split('\n') if line.strip()]
-    return machines
+    return await cached_machines()
+
+
+def fresh_machines(ttl: float = CACHE_TTL) -> Optional[List[str]]:
+    """Return the cached machine list if it is younger than ttl seconds"""
+    if _MACHINES_CACHE is not None and time.monotonic() - _MACHINES_CACHE[0] < ttl:
+        return _MACHINES_CACHE[1]
+    return None
+
+
+def store_machines(machines: List[str]) -> None:
+    """Replace the cached machine list"""
+    global _MACHINES_CACHE
+    _MACHINES_CACHE = (time.monotonic(), machines)
+
+
+async def cached_machines(ttl: float = CACHE_TTL) -> List[str]:
+    """Return the machine list, fetching it with oarnodes -l when the cache is stale"""
+    machines = fresh_machines(ttl)
+    if machines is not None:
+        return machines
+    async with _machines_lock:
+        # Another task may have refreshed the cache while we waited
+        machines = fresh_machines(ttl)
+        if machines is None:
+            machines = parse_machines(await run_ssh_command("oarnodes -l"))
+            store_machines(machines)
+        return machines
+
+
+def parse_machines(output: str) -> List[str]:
+    """Parse the output of oarnodes -l into a list of hostnames"""
+    return [line.strip() for line in output.split('\n') if line.strip()]
+
+
+def cluster_names(machines: List[str]) -> List[str]:
+    """Extract the sorted unique cluster names from a list of hostnames"""
+    # Take the part before the first '-'
+    clusters = {m.partition('-')[0] for m in machines if '-' in m}
+    return sorted(clusters)
 
 
 @mcp.tool()
 async def list_machines_detailed() -> Dict[str, Any]:
     """List all machines with detailed information in JSON format"""
-    output = await run_ssh_command("oarnodes -J")
-    try:
-        return json.loads(output)
-    except json.JSONDecodeError as e:
-        return {"error": f"Failed to parse JSON output: {str(e)}", "raw_output": output}
+    global _MACHINES_DETAILED_CACHE
+    async with _machines_detailed_lock:
+        if _MACHINES_DETAILED_CACHE is not None and time.monotonic() - _MACHINES_DETAILED_CACHE[0] < CACHE_TTL:
+            return _MACHINES_DETAILED_CACHE[1]
+        machines = await ssh_json("oarnodes -J", "Failed to list machines")
+        if "error" not in machines:
+            _MACHINES_DETAILED_CACHE = (time.monotonic(), machines)
+        return machines
 
 
 @mcp.tool()
 async def list_clusters() -> List[str]:
     """List all unique cluster names (machine types)"""
     machines = await list_machines()
-    clusters = set()
-    
-    for machine in machines:
-        # Split by first '-' and take the part before it
-        if '-' in machine:
-            cluster_name = machine.split('-')[0]
-            clusters.add(cluster_name)
-    
-    return sorted(list(clusters))
+    return cluster_names(machines)
+
+
+@mcp.tool()
+async def refresh_cache() -> str:
+    """Discard the cached machine lists so the next request fetches them from the cluster"""
+    global _MACHINES_CACHE, _MACHINES_DETAILED_CACHE
+    _MACHINES_CACHE = None
+    _MACHINES_DETAILED_CACHE = None
+    return "Machine cache cleared"
 
 
 @mcp.tool()
 async def delete_job(job_id: int) -> str:
     """Delete a job by its ID"""
+    returncode, output, error = await oardel([job_id])
+    if returncode is None:
+        return f"Failed to delete job {job_id}: {error}"
+    if returncode != 0:
+        return f"Failed to delete job {job_id}: Command failed: {error}"
+    return f"Job {job_id} deletion requested: {output}"
+
+
+@mcp.tool()
+async def delete_jobs(job_ids: List[int]) -> Dict[str, Any]:
+    """
+    Delete several jobs with a single oardel call
+    
+    Args:
+        job_ids: The job IDs to delete
+    """
+    if not job_ids:
+        return {"error": "No job IDs given"}
+    returncode, output, error = await oardel(job_ids)
+    if returncode is None:
+        return {"error": f"Failed to delete jobs {job_ids}: {error}"}
+    
+    # oardel reports each job as "Deleting the job = <id> ...<STATUS>.", even
+    # when it exits non-zero because some of the jobs could not be deleted
+    statuses = dict(_OARDEL_STATUS_RE.findall(output))
+    if returncode != 0 and not statuses:
+        return {"error": f"Failed to delete jobs {job_ids}: Command failed: {error}"}
+    
+    result = {
+        "output": output,
+        "jobs": {
+            str(job_id): {
+                "deleted": statuses.get(str(job_id)) == "REGISTERED",
+                "status": statuses.get(str(job_id))
+            }
+            for job_id in job_ids
+        }
+    }
+    if returncode != 0:
+        result["error_output"] = error
+    return result
+
+
+async def oardel(job_ids: List[int]) -> tuple[Optional[int], str, str]:
+    """
+    Request the deletion of the given jobs in one round-trip
+
+    Returns (returncode, stdout, stderr). stdout is kept even on a non-zero
+    exit, since oardel fails if any single job could not be deleted. If the
+    command could not run at all, returncode is None and stderr holds the reason.
+    """
     try:
-        output = await run_ssh_command(f"oardel {job_id}")
-        return f"Job {job_id} deletion requested: {output}"
+        return await _ssh_exec("oardel " + " ".join(str(job_id) for job_id in job_ids))
     except ValueError as e:
-        return f"Failed to delete job {job_id}: {str(e)}"
+        return None, "", str(e)
+
+
+def valid_walltime(value: str) -> bool:
+    """Check that value is a hh:mm:ss time with minutes and seconds below 60"""
+    match = _WALLTIME_RE.match(value)
+    return bool(match) and int(match["minutes"]) < 60 and int(match["seconds"]) < 60
 
 
 @mcp.tool()
@@ -105,19 +617,18 @@ async def extend_walltime(job_id: int, additional_time: str, force: bool = False
         additional_time: Additional time in format hh:mm:ss (e.g., "1:30:00" for 1.5 hours)
         force: Whether to force the change to apply immediately
     """
-    try:
-        # Validate time format
-        if not re.match(r'^\d{1,2}:\d{2}:\d{2}$', additional_time):
-            return "Invalid time format. Use hh:mm:ss (e.g., '1:30:00')"
-        
-        command = f"oarwalltime {job_id} +{additional_time}"
-        if force:
-            command += " --force"
-        
-        output = await run_ssh_command(command)
-        return f"Extended walltime for job {job_id}: {output}"
-    except ValueError as e:
-        return f"Failed to extend walltime for job {job_id}: {str(e)}"
+    # Validate time format
+    if not valid_walltime(additional_time):
+        return "Invalid time format. Use hh:mm:ss (e.g., '1:30:00')"
+    
+    command = f"oarwalltime {job_id} +{additional_time}"
+    if force:
+        command += " --force"
+    
+    ok, output = await run_ssh(command)
+    if not ok:
+        return f"Failed to extend walltime for job {job_id}: {output}"
+    return f"Extended walltime for job {job_id}: {output}"
 
 
 @mcp.tool()
@@ -128,11 +639,19 @@ async def get_walltime_status(job_id: int) -> str:
     Args:
         job_id: The job ID to check
     """
-    try:
-        output = await run_ssh_command(f"oarwalltime {job_id}")
-        return f"Walltime status for job {job_id}: {output}"
-    except ValueError as e:
-        return f"Failed to get walltime status for job {job_id}: {str(e)}"
+    ok, output = await run_ssh(f"oarwalltime {job_id}")
+    if not ok:
+        return f"Failed to get walltime status for job {job_id}: {output}"
+    return f"Walltime status for job {job_id}: {output}"
+
+
+def validate_clusters(clusters: List[str], machines: List[str]) -> Optional[str]:
+    """Return an error message if any of the clusters is not in the machine list"""
+    available_clusters = cluster_names(machines)
+    invalid_clusters = [c for c in clusters if c not in available_clusters]
+    if invalid_clusters:
+        return f"Invalid clusters: {invalid_clusters}. Available: {available_clusters}"
+    return None
 
 
 @mcp.tool()
@@ -157,22 +676,17 @@ async def create_job(
     """
     try:
         # Validate walltime format
-        if not re.match(r'^\d{1,2}:\d{2}:\d{2}$', walltime):
+        if not valid_walltime(walltime):
             return "Invalid walltime format. Use hh:mm:ss (e.g., '1:00:00')"
         
+        # Validate node count
+        if not isinstance(nodes, int) or nodes < 1:
+            return "Invalid number of nodes. Request at least 1 node"
+        
         # Build resource specification with cluster constraints
         if clusters:
-            available_clusters = await list_clusters()
-            invalid_clusters = [c for c in clusters if c not in available_clusters]
-            if invalid_clusters:
-                return f"Invalid clusters: {invalid_clusters}. Available: {available_clusters}"
-            
-            if len(clusters) == 1:
-                cluster_part = f"{{cluster in ('{clusters[0]}')}}"
-            else:
-                cluster_list = "', '".join(clusters)
-                cluster_part = f"{{cluster in ('{cluster_list}')}}"
-            
+            cluster_list = "', '".join(clusters)
+            cluster_part = f"{{cluster in ('{cluster_list}')}}"
             resource_string = f"{cluster_part}/nodes={nodes},walltime={walltime}"
         else:
             resource_string = f"nodes={nodes},walltime={walltime}"
@@ -191,24 +705,45 @@ async def create_job(
         # Add the command to execute
         oarsub_args.append(command)
         
-        # Execute the command - need special handling for -l argument with cluster constraints
-        if clusters:
-            # Build command with proper quoting for resource specification
-            cmd_parts = ["oarsub", "-l"]
-            cmd_parts.append(f'"{resource_string}"')
-            if name:
-                cmd_parts.extend(["-n", name])
-            if best_effort:
-                cmd_parts.extend(["-t", "besteffort"])
-            cmd_parts.append(f"'{command}'")
-            full_command = " ".join(cmd_parts)
-        else:
-            full_command = " ".join(f"'{arg}'" if " " in arg else arg for arg in oarsub_args)
+        # Quote every argument once for the remote shell
+        full_command = shlex.join(oarsub_args)
         
-        output = await run_ssh_command(full_command)
+        machines = fresh_machines() if clusters else None
+        if machines is not None:
+            # Validate against the cached machine list, so invalid clusters
+            # are rejected without any SSH round-trip
+            invalid_message = validate_clusters(clusters, machines)
+            if invalid_message:
+                return invalid_message
+            output = await run_ssh_command(full_command)
+        elif clusters:
+            # Fetch the machine list and submit in one round-trip, only running
+            # oarsub remotely if every requested cluster exists. Lines are
+            # stripped of leading whitespace to match parse_machines
+            guard = " && ".join(
+                f'printf "%s\\n" "$machines" | sed "s/^[[:space:]]*//" | cut -s -d- -f1 | grep -qxF -- {shlex.quote(c)}'
+                for c in clusters
+            )
+            machines_output, output = await run_ssh_batch([
+                'machines=$(oarnodes -l) && printf "%s\\n" "$machines"',
+                f"if {guard}; then {full_command}; else echo {SKIPPED_MARKER}; fi",
+            ])
+            machines = parse_machines(machines_output)
+            store_machines(machines)
+            invalid_message = validate_clusters(clusters, machines)
+            if invalid_message:
+                return invalid_message
+            if output == SKIPPED_MARKER:
+                return {
+                    "status": "error",
+                    "message": f"Job submission skipped: the cluster rejected clusters {clusters}",
+                    "submission_output": None
+                }
+        else:
+            output = await run_ssh_command(full_command)
         
         # Extract job ID from output
-        job_id_match = re.search(r'OAR_JOB_ID=(\d+)', output)
+        job_id_match = _JOBID_RE.search(output)
         if job_id_match:
             job_id = int(job_id_match.group(1))
             
@@ -261,23 +796,42 @@ async def create_job(
 @mcp.tool()
 async def get_job_status(job_id: int) -> Dict[str, Any]:
     """Get the detailed status of a specific job in JSON format"""
-    try:
-        output = await run_ssh_command(f"oarstat -j {job_id} -J")
-        return json.loads(output)
-    except json.JSONDecodeError as e:
-        return {"error": f"Failed to parse JSON output: {str(e)}", "raw_output": output}
-    except ValueError as e:
-        return {"error": f"Failed to get job status for {job_id}: {str(e)}"}
+    return await ssh_json(f"oarstat -j {job_id} -J", f"Failed to get job status for {job_id}")
 
 
 @mcp.tool()
 async def list_all_jobs() -> Dict[str, Any]:
-    """List all jobs in the cluster with detailed JSON information"""
+    """
+    List all jobs in the cluster with detailed JSON information
+
+    If the output is not valid JSON, raw_output holds at most the last 128 KiB
+    received (all of it when ijson is not installed).
+    """
+    if ijson is not None:
+        return await _stream_all_jobs()
+    return await ssh_json("oarstat -J", "Failed to list jobs")
+
+
+async def _stream_all_jobs() -> Dict[str, Any]:
+    """Parse oarstat -J job by job as it arrives instead of buffering the whole document"""
+    jobs = {}
+    # Output around the parse position, reported like ssh_json's raw_output on failure
+    recent = collections.deque(maxlen=2)
+    events = ijson.sendable_list()
+    parser = ijson.kvitems_coro(events, '', use_float=True)
     try:
-        output = await run_ssh_command("oarstat -J")
-        return json.loads(output)
-    except json.JSONDecodeError as e:
-        return {"error": f"Failed to parse JSON output: {str(e)}", "raw_output": output}
+        # aclosing releases the SSH session as soon as parsing fails
+        async with contextlib.aclosing(ssh_stream("oarstat -J")) as stream:
+            async for chunk in stream:
+                recent.append(chunk)
+                parser.send(chunk)
+                jobs.update(events)
+                del events[:]
+        parser.close()
+        jobs.update(events)
+        return jobs
+    except ijson.JSONError as e:
+        return {"error": f"Failed to parse JSON output: {str(e)}", "raw_output": b"".join(recent).strip().decode(errors="replace")}
     except ValueError as e:
         return {"error": f"Failed to list jobs: {str(e)}"}
 
@@ -286,21 +840,19 @@ async def list_all_jobs() -> Dict[str, Any]:
 async def list_my_jobs() -> Dict[str, Any]:
     """List jobs for the current SSH user with detailed JSON information"""
     try:
-        # First check if user has jobs with regular oarstat
-        regular_output = await run_ssh_command("oarstat -u")
+        # Fetch both the regular and JSON output in a single round-trip, only
+        # running oarstat -u -J if the user has jobs
+        regular_output, output = await run_ssh_batch([
+            'jobs=$(oarstat -u) && printf "%s\\n" "$jobs"',
+            'case "$jobs" in *[![:space:]]*) oarstat -u -J;; esac',
+        ])
         if not regular_output.strip():
             return {"message": "No jobs found for current user", "jobs": {}}
         
-        # If user has jobs, get JSON output
-        output = await run_ssh_command("oarstat -u -J")
-        return json.loads(output)
-    except json.JSONDecodeError as e:
+        return json_loads(output)
+    except JSONDecodeError:
         # Fallback to regular output if JSON fails
-        try:
-            regular_output = await run_ssh_command("oarstat -u")
-            return {"message": "Jobs for current user (text format due to JSON parsing error)", "output": regular_output}
-        except ValueError:
-            return {"error": f"Failed to parse JSON output and fallback failed: {str(e)}", "raw_output": output}
+        return {"message": "Jobs for current user (text format due to JSON parsing error)", "output": regular_output}
     except ValueError as e:
         return {"error": f"Failed to list jobs for current user: {str(e)}"}
 
@@ -308,23 +860,20 @@ async def list_my_jobs() -> Dict[str, Any]:
 @mcp.resource("cluster://config")
 def get_cluster_config() -> str:
     """Get the current cluster configuration"""
-    return f"""NOVA OAR Cluster Configuration:
-- Cluster Hostname: {CLUSTER_HOSTNAME}
-- Default Walltime: 1:00:00
-- Default Nodes: 1
-- Default Command: sleep 365d
-
-Available OAR Commands:
-- List machines: oarnodes -l
-- List jobs: oarstat
-- Create job: oarsub -l <resources> <command>
-- Delete job: oardel <jobid>
-- Extend walltime: oarwalltime <jobid> +<time>
-"""
+    return CLUSTER_CONFIG
 
 
 def main():
     """Entry point for the nova-oar-mcp command"""
+    # Use uvloop's faster event loop when it is installed
+    try:
+        import uvloop
+        asyncio.set_event_loop_policy(uvloop.EventLoopPolicy())
+    except ImportError:
+        pass
+    if SSH_BACKEND == "openssh":
+        start_ssh_master()
+        atexit.register(stop_ssh_master)
     mcp.run()
 
 